@@ -1,24 +1,22 @@
 # backend/api/admin.py
+from typing import Optional
 from fastapi import APIRouter, Depends, Query
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
 from db import get_db
 from models_db import AuctionSheet, Vehicle
+from services import cache
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
+# 超簡易エスケープ + 改行は <br>（str.translate で1パス）
+_ESC_TABLE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", "\n": "<br>"})
+
 def _esc(s):
     if s is None:
         return ""
-    # 超簡易エスケープ + 改行は <br>
-    return (
-        str(s)
-        .replace("&", "&amp;")
-        .replace("<", "&lt;")
-        .replace(">", "&gt;")
-        .replace("\n", "<br>")
-    )
+    return str(s).translate(_ESC_TABLE)
 
 _BASE_CSS = """
 table{border-collapse:collapse;font-family:system-ui,Segoe UI,Arial; font-size:14px}
@@ -28,13 +26,48 @@ h2{font-family:system-ui,Segoe UI,Arial}
 a{color:#1f6feb;text-decoration:none}
 """
 
+# ページ共通の先頭/末尾は bytes で1回だけ作っておく（リクエスト毎の連結・encode を省く）
+_HTML_HEAD = (
+    "<html><head><meta charset='utf-8'>"
+    f"<style>{_BASE_CSS}</style>"
+    "</head><body>"
+).encode("utf-8")
+_HTML_FOOT = b"</body></html>"
+_HTML_MEDIA_TYPE = "text/html; charset=utf-8"
+
+def _html_response(body: str) -> Response:
+    return Response(content=_HTML_HEAD + body.encode("utf-8") + _HTML_FOOT, media_type=_HTML_MEDIA_TYPE)
+
+# 行テンプレートはモジュール読み込み時に1回だけ用意（値は _esc 済みのタプルを % で流し込む）
+_SHEET_ROW_FMT = (
+    "<tr>"
+    "<td>%s</td>"       # id
+    "<td>%s</td>"       # file_name
+    "<td>%s</td>"       # auction_name
+    "<td>%s</td>"       # auction_date
+    "<td>%s</td>"       # uploaded_at
+    "<td><a href='/admin/vehicles?sheet_id=%s'>%s</a></td>"   # id, vehicle_count
+    "</tr>"
+)
+
+# id, sheet_id, 以降 _esc 済みの13列（auction_no 〜 lane）
+_VEHICLE_ROW_FMT = "<tr>" + "<td>%s</td>" * 15 + "</tr>"
+
 @router.get("/sheets", response_class=HTMLResponse)
 def list_sheets(
     limit: int = Query(50, ge=1, le=500),
+    before_id: Optional[int] = Query(None, ge=1),   # キーセット方式のページング（このIDより古いもの）
     db: Session = Depends(get_db),
 ):
-    rows = (
-        db.query(
+    # 最新シートIDをバージョンとしてキャッシュキーに含める（アップロードで必ず変わる）
+    version = db.query(func.max(AuctionSheet.id)).scalar()
+    key = ("admin.sheets", limit, before_id, version)
+    cached = cache.get(key)
+    if cached is not None:
+        return Response(content=cached, media_type=_HTML_MEDIA_TYPE)
+
+    stmt = (
+        select(
             AuctionSheet.id,
             AuctionSheet.file_name,
             AuctionSheet.auction_name,
@@ -43,39 +76,44 @@ def list_sheets(
             func.count(Vehicle.id).label("vehicle_count"),
         )
         .outerjoin(Vehicle, Vehicle.sheet_id == AuctionSheet.id)
-        .group_by(AuctionSheet.id)
-        .order_by(AuctionSheet.id.desc())
-        # .limit(limit)
-        .all()
     )
+    if before_id is not None:
+        stmt = stmt.where(AuctionSheet.id < before_id)
+    stmt = stmt.group_by(AuctionSheet.id).order_by(AuctionSheet.id.desc()).limit(limit)
+    # 結果は yield_per で分割フェッチしながら行ごとに HTML 化する（Row のリストを作らない）
+    result = db.execute(stmt.execution_options(yield_per=200))
+
     html = [
-        "<html><head><meta charset='utf-8'>",
-        f"<style>{_BASE_CSS}</style>",
-        "</head><body>",
         f"<h2>Auction Sheets (latest {limit})</h2>",
         "<table><tr><th>ID</th><th>File</th><th>Auction</th><th>Date</th><th>Uploaded</th><th>Vehicles</th></tr>"
     ]
-    for r in rows:
-        html.append(
-            "<tr>"
-            f"<td>{r.id}</td>"
-            f"<td>{_esc(r.file_name)}</td>"
-            f"<td>{_esc(r.auction_name)}</td>"
-            f"<td>{_esc(r.auction_date)}</td>"
-            f"<td>{_esc(r.uploaded_at)}</td>"
-            f"<td><a href='/admin/vehicles?sheet_id={r.id}'>{r.vehicle_count}</a></td>"
-            "</tr>"
-        )
-    html.append("</table></body></html>")
-    return "".join(html)
+    n_rows, last_id = 0, None
+    for r in result:
+        html.append(_SHEET_ROW_FMT % (
+            r.id,
+            _esc(r.file_name),
+            _esc(r.auction_name),
+            _esc(r.auction_date),
+            _esc(r.uploaded_at),
+            r.id,
+            r.vehicle_count,
+        ))
+        n_rows, last_id = n_rows + 1, r.id
+    html.append("</table>")
+    if n_rows == limit:
+        html.append(f"<p><a href='/admin/sheets?limit={limit}&before_id={last_id}'>next &raquo;</a></p>")
+    resp = _html_response("".join(html))
+    cache.put(key, resp.body)
+    return resp
 
 @router.get("/vehicles", response_class=HTMLResponse)
 def list_vehicles(
     sheet_id: int = Query(..., ge=1),
     limit: int = Query(200, ge=1, le=1000),
+    after_id: Optional[int] = Query(None, ge=1),    # キーセット方式のページング（このIDより後ろ）
     db: Session = Depends(get_db),
 ):
-    rows = (
+    q = (
         db.query(
             Vehicle.id,
             Vehicle.sheet_id,
@@ -86,47 +124,41 @@ def list_vehicles(
             Vehicle.model_code,
             Vehicle.year,
             Vehicle.mileage_km,
+            Vehicle.color,
+            Vehicle.shift,
+            Vehicle.inspection_until,
             Vehicle.start_price_yen,
             Vehicle.score,
             Vehicle.lane,            # ← 追加
         )
         .filter(Vehicle.sheet_id == sheet_id)
-        .order_by(Vehicle.id.asc())
-        #.limit(limit)
-        .all()
     )
+    if after_id is not None:
+        q = q.filter(Vehicle.id > after_id)
+    # 出品順（id 昇順）のまま表示する
+    rows = q.order_by(Vehicle.id.asc()).limit(limit).all()
     html = [
-        "<html><head><meta charset='utf-8'>",
-        f"<style>{_BASE_CSS}</style>",
-        "</head><body>",
-        f"<h2>Vehicles for Sheet #{sheet_id} (all)</h2>",
+        f"<h2>Vehicles for Sheet #{sheet_id} (up to {limit})</h2>",
         "<p><a href='/admin/sheets'>&laquo; back</a></p>",
         "<table><tr>"
         "<th>ID</th><th>Sheet</th><th>Shuppin_No</th><th>Maker</th><th>Car</th>"
-        "<th>Grade</th><th>Nenshiki</th><th>Katashiki</th><th>Haikiryou</th><th>kyori</th><th>Iro</th><th>Shift</th><th>AC</th><th>Soubi</th><th>Score</th><th>Start</th><th>Lane</th>"
+        "<th>Grade</th><th>Nenshiki</th><th>Katashiki</th><th>kyori</th><th>Iro</th><th>Shift</th><th>Shaken</th><th>Score</th><th>Start</th><th>Lane</th>"
         "</tr>"
     ]
-    for r in rows:
+    html.append("".join(
+        _VEHICLE_ROW_FMT % (
+            r.id,
+            r.sheet_id,
+            *map(_esc, (
+                r.auction_no, r.maker, r.car_name, r.grade, r.year, r.model_code, r.mileage_km,
+                r.color, r.shift, r.inspection_until, r.score, r.start_price_yen, r.lane,
+            )),
+        )
+        for r in rows
+    ))
+    html.append("</table>")
+    if len(rows) == limit:
         html.append(
-            "<tr>"
-            f"<td>{r.id}</td>"
-            f"<td>{r.sheet_id}</td>"
-            f"<td>{_esc(r.auction_no)}</td>"
-            f"<td>{_esc(r.maker)}</td>"
-            f"<td>{_esc(r.car_name)}</td>"
-            f"<td>{_esc(r.grade)}</td>"
-            f"<td>{_esc(r.year)}</td>"
-            f"<td>{_esc(r.model_code)}</td>"
-            f"<td>{_esc(r.model_code)}</td>"
-            f"<td>{_esc(r.mileage_km)}</td>"
-            f"<td>{_esc(r.model_code)}</td>"
-            f"<td>{_esc(r.model_code)}</td>"
-            f"<td>{_esc(r.model_code)}</td>"
-            f"<td>{_esc(r.model_code)}</td>"
-            f"<td>{_esc(r.score)}</td>"
-            f"<td>{_esc(r.start_price_yen)}</td>"
-            f"<td>{_esc(r.lane)}</td>"
-            "</tr>"
+            f"<p><a href='/admin/vehicles?sheet_id={sheet_id}&limit={limit}&after_id={rows[-1].id}'>next &raquo;</a></p>"
         )
-    html.append("</table></body></html>")
-    return "".join(html)
+    return _html_response("".join(html))
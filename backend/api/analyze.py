@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, undefer
 from db import get_db
 from models_db import Vehicle, Valuation
 from shared.models import AnalyzeParams, ValuationOut
@@ -9,7 +9,7 @@ router = APIRouter()
 
 @router.post("/vehicles/{vehicle_id}/analyze", response_model=ValuationOut)
 def analyze_vehicle(vehicle_id: int, params: AnalyzeParams = AnalyzeParams(), db: Session = Depends(get_db)):
-    v = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
+    v = db.query(Vehicle).options(undefer(Vehicle.raw_extracted_json)).filter(Vehicle.id == vehicle_id).first()
     if not v:
         raise HTTPException(status_code=404, detail="Vehicle not found")
 
@@ -39,11 +39,10 @@ def analyze_vehicle(vehicle_id: int, params: AnalyzeParams = AnalyzeParams(), db
         assumptions_json=assumptions,
     )
     db.add(val)
-    db.flush()
-    db.refresh(val)
-    db.commit()
+    db.flush()  # id / created_at(Python 側 default) はここで確定するので refresh 不要
 
-    return ValuationOut(
+    # commit すると属性が expire されて再 SELECT になるので、先にレスポンスを組み立てる
+    out = ValuationOut(
         id=val.id,
         vehicle_id=val.vehicle_id,
         algo_version=val.algo_version,
@@ -53,3 +52,5 @@ def analyze_vehicle(vehicle_id: int, params: AnalyzeParams = AnalyzeParams(), db
         assumptions_json=val.assumptions_json,
         created_at=val.created_at,
     )
+    db.commit()
+    return out
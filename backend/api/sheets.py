@@ -1,14 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.orm import Session, selectinload
 from db import get_db
-from models_db import AuctionSheet
+from models_db import AuctionSheet, Vehicle
 from shared.models import AuctionSheetOut, VehicleOut
+from services import cache
 
 router = APIRouter()
 
 @router.get("/sheets", response_model=list[AuctionSheetOut])
 def list_sheets(db: Session = Depends(get_db)):
-    sheets = db.query(AuctionSheet).order_by(AuctionSheet.uploaded_at.desc()).all()
+    # 最新シートIDをバージョンとしてキャッシュキーに含める（アップロードで必ず変わる）
+    version = db.query(func.max(AuctionSheet.id)).scalar()
+    key = ("sheets", version)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    # vehicles は selectinload で一括取得（シートごとの遅延ロード = N+1 を避ける）
+    # raw_extracted_json は deferred なので、ここでは undefer して同じ SELECT で読む
+    sheets = (
+        db.query(AuctionSheet)
+        .options(selectinload(AuctionSheet.vehicles).undefer(Vehicle.raw_extracted_json))
+        .order_by(AuctionSheet.uploaded_at.desc())
+        .all()
+    )
     out = []
     for s in sheets:
         vouts = [
@@ -25,11 +41,17 @@ def list_sheets(db: Session = Depends(get_db)):
             id=s.id, file_name=s.file_name, auction_name=s.auction_name,
             auction_date=s.auction_date, uploaded_at=s.uploaded_at, vehicles=vouts
         ))
+    cache.put(key, out)
     return out
 
 @router.get("/sheets/{sheet_id}", response_model=AuctionSheetOut)
 def get_sheet(sheet_id: int, db: Session = Depends(get_db)):
-    s = db.query(AuctionSheet).filter(AuctionSheet.id == sheet_id).first()
+    s = (
+        db.query(AuctionSheet)
+        .options(selectinload(AuctionSheet.vehicles).undefer(Vehicle.raw_extracted_json))
+        .filter(AuctionSheet.id == sheet_id)
+        .first()
+    )
     if not s:
         raise HTTPException(status_code=404, detail="Sheet not found")
     vouts = [
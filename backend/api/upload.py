@@ -1,4 +1,5 @@
-# 先頭の import に追加
+# backend/api/upload.py
+import logging
 import re
 from typing import Optional, List, Dict, Any
 from pydantic import ValidationError
@@ -8,13 +9,16 @@ from fastapi.responses import JSONResponse
 from datetime import date
 
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from db import get_db
 from models_db import AuctionSheet, Vehicle
-from shared.models import AuctionSheetOut, VehicleOut
-from services import parser
+from shared.models import AuctionSheetOut
+from services import parser, cache
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 # ========= 追加: 改行で複数台を1台ずつに展開するヘルパー =========
@@ -22,14 +26,22 @@ router = APIRouter()
 # 実改行: \r, \n, Unicode LSEP/PSEP / 文字列の "\r\n" "\n" "\r" の両対応
 _SPLIT_NL = re.compile(r"(?:\r\n|\r|\n|\\r\\n|\\n|\\r|\u2028|\u2029)+")
 
+def _has_nl(s: str) -> bool:
+    # 大半のセルは1行なので、正規表現を走らせる前に `in` だけで判定する
+    return (
+        "\n" in s or "\r" in s or "\u2028" in s or "\u2029" in s
+        or "\\n" in s or "\\r" in s
+    )
+
 def _split_lines(x: Any) -> List[str]:
     if x is None:
         return []
     s = str(x).strip()
     if not s:
         return []
-    parts = [p.strip() for p in _SPLIT_NL.split(s)]
-    return [p for p in parts if p]  # 空は除去
+    if not _has_nl(s):
+        return [s]
+    return [p for p in (q.strip() for q in _SPLIT_NL.split(s)) if p]  # 空は除去
 
 def _normalize_score(x: Any):
     if x is None:
@@ -54,9 +66,13 @@ def _expand_by_index(v: Dict[str, Any], multiline_cols: Optional[List[str]] = No
         for k, val in v.items():
             if isinstance(val, (str, bytes)):
                 s = val.decode() if isinstance(val, bytes) else val
-                if _SPLIT_NL.search(s):
+                if _has_nl(s) and _SPLIT_NL.search(s):
                     multiline_cols.append(k)
 
+    # 大半の行はどの列にも改行が無いので、regex 分割に入る前に素通しする
+    if not any(_has_nl(str(v[k])) for k in multiline_cols if v.get(k) is not None):
+        return [v]
+
     splits: Dict[str, List[str]] = {}
     max_len = 1
     for k in multiline_cols:
@@ -81,11 +97,9 @@ def _expand_by_index(v: Dict[str, Any], multiline_cols: Optional[List[str]] = No
         rec["score"] = _normalize_score(rec.get("score"))
         out.append(rec)
 
-    # デバッグ：どの列が何行に割れたかをログに出す（必要なら print を logger に）
-    try:
-        print("[expand] cols=", multiline_cols, "lens=", {k: len(splits.get(k, [])) for k in multiline_cols})
-    except Exception:
-        pass
+    # デバッグ：どの列が何行に割れたかをログに出す（DEBUG 有効時だけ dict を組み立てる）
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[expand] cols=%s lens=%s", multiline_cols, {k: len(splits.get(k, [])) for k in multiline_cols})
 
     return out
 # --- helpers end ---
@@ -100,6 +114,8 @@ def _safe_int(val: Optional[int], max_abs: int = 2_000_000_000) -> Optional[int]
     """
     if val is None:
         return None
+    if type(val) is int:  # パーサ出力は既に int のことが多いので文字列化を省く
+        return val if -max_abs <= val <= max_abs else None
     try:
         iv = int(str(val).strip())
         if -max_abs <= iv <= max_abs:
@@ -109,6 +125,20 @@ def _safe_int(val: Optional[int], max_abs: int = 2_000_000_000) -> Optional[int]
         return None
 
 
+# 整数カラムごとの許容範囲（_safe_int の max_abs）
+_INT_LIMITS: Dict[str, int] = {
+    "auction_no": 9_999_999,
+    "year": 3000,
+    "mileage_km": 10_000_000,
+    "start_price_yen": 1_000_000_000,
+}
+
+def _coerce_int_columns(rows: List[Dict[str, Any]]) -> None:
+    """整数カラムを列ごとにまとめて _safe_int で安全化する（rows をその場で書き換え）。"""
+    for col, max_abs in _INT_LIMITS.items():
+        for v in rows:
+            v[col] = _safe_int(v.get(col), max_abs)
+
 def _to_date_if_needed(val) -> Optional[date]:
     """
     parsed["auction_date"] が str の場合は date に変換して返す。
@@ -125,20 +155,12 @@ def _to_date_if_needed(val) -> Optional[date]:
             return None
     return None
 
-@router.post("/upload", response_model=AuctionSheetOut)
-async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)):
+def _persist(parsed: Dict[str, Any], db: Session):
     """
-    方針B：毎回このアップロード結果だけを残す。
-    手順: 新規シート作成 -> 旧シート(=今回以外)を全削除 -> 展開済みvehiclesを挿入
-    すべて1トランザクションで実施（途中失敗は全ロールバック）。
+    解析結果を1トランザクションで保存してレスポンスを返す（同期処理）。
+    SQLAlchemy の呼び出しはブロッキングなので upload_pdf からスレッドプール経由で呼ぶ。
     """
-    # 1) PDF解析（出品票メタ＋車両リストを得る）
-    try:
-        content = await file.read()
-        parsed = parser.parse_auction_sheet(content, file.filename)  # AuctionSheetIn 相当の dict
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to parse PDF: {e}")
-
+    vouts: List[Dict[str, Any]] = []
     try:
         # === トランザクション開始 ===
         with db.begin():
@@ -169,47 +191,58 @@ async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)
                         "color", "shift", "inspection_until"
                     ]
                 ))
+            _coerce_int_columns(expanded)
 
-            vouts: List[VehicleOut] = []
-            for v in expanded:
-                vo = Vehicle(
-                    sheet_id=sheet.id,
-                    auction_no=_safe_int(v.get("auction_no"), max_abs=9_999_999),
-                    maker=v.get("maker"),
-                    car_name=v.get("car_name"),
-                    grade=v.get("grade"),
-                    model_code=v.get("model_code"),
-                    year=_safe_int(v.get("year"), max_abs=3000),
-                    mileage_km=_safe_int(v.get("mileage_km"), max_abs=10_000_000),
-                    color=v.get("color"),
-                    shift=v.get("shift"),
-                    inspection_until=v.get("inspection_until"),
-                    score=v.get("score"),
-                    start_price_yen=_safe_int(v.get("start_price_yen"), max_abs=1_000_000_000),
-                    raw_extracted_json=v.get("raw_extracted_json"),
-                )
-                db.add(vo)
-                db.flush()
-                vouts.append(VehicleOut(
-                    id=vo.id, auction_no=vo.auction_no, maker=vo.maker, car_name=vo.car_name,
-                    grade=vo.grade, model_code=vo.model_code, year=vo.year, mileage_km=vo.mileage_km,
-                    color=vo.color, shift=vo.shift, inspection_until=vo.inspection_until,
-                    score=(str(vo.score) if vo.score is not None else None),
-                    start_price_yen=vo.start_price_yen,
-                    raw_extracted_json=vo.raw_extracted_json
-                ))
+            # ORM オブジェクトを作らず、INSERT ... RETURNING id を1文（executemany）で実行
+            rows: List[Dict[str, Any]] = [
+                {
+                    "sheet_id": sheet.id,
+                    "auction_no": v["auction_no"],
+                    "maker": v.get("maker"),
+                    "car_name": v.get("car_name"),
+                    "grade": v.get("grade"),
+                    "model_code": v.get("model_code"),
+                    "year": v["year"],
+                    "mileage_km": v["mileage_km"],
+                    "color": v.get("color"),
+                    "shift": v.get("shift"),
+                    "inspection_until": v.get("inspection_until"),
+                    "score": v.get("score"),
+                    "start_price_yen": v["start_price_yen"],
+                    "raw_extracted_json": v.get("raw_extracted_json"),
+                }
+                for v in expanded
+            ]
+            ids: List[int] = []
+            if rows:
+                ids = db.scalars(
+                    insert(Vehicle).returning(Vehicle.id, sort_by_parameter_order=True),
+                    rows,
+                ).all()
+
+            # レスポンス用は素の dict にしておき、最後に AuctionSheetOut で1回だけ検証する
+            vouts = [
+                {
+                    **r,
+                    "id": vid,
+                    "auction_no": (str(r["auction_no"]) if r["auction_no"] is not None else None),
+                    "score": (str(r["score"]) if r["score"] is not None else None),
+                }
+                for vid, r in zip(ids, rows)
+            ]
 
         # === ここで commit 済み ===
+        cache.clear()  # 一覧系のキャッシュを破棄
 
         # ---- レスポンス生成（Pydantic検証つき） ----
-        payload = AuctionSheetOut(
-            id=sheet.id,
-            file_name=sheet.file_name,
-            auction_name=sheet.auction_name,
-            auction_date=sheet.auction_date,
-            uploaded_at=sheet.uploaded_at,
-            vehicles=vouts,
-        )
+        payload = AuctionSheetOut.model_validate({
+            "id": sheet.id,
+            "file_name": sheet.file_name,
+            "auction_name": sheet.auction_name,
+            "auction_date": sheet.auction_date,
+            "uploaded_at": sheet.uploaded_at,
+            "vehicles": vouts,
+        })
         return payload
 
     except ValidationError as ve:
@@ -226,10 +259,28 @@ async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)
                     "auction_name": sheet.auction_name,
                     "auction_date": sheet.auction_date,
                     "uploaded_at": sheet.uploaded_at,
-                    "vehicles": [jsonable_encoder(v) for v in vouts],
+                    "vehicles": vouts,  # 外側の jsonable_encoder がまとめて変換する
                 })
             }
         )
     except Exception as e:
         # パース・挿入・削除など途中での失敗はすべてロールバックされる
         raise HTTPException(status_code=400, detail=f"Upload failed: {e}")
+
+@router.post("/upload", response_model=AuctionSheetOut)
+async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """
+    方針B：毎回このアップロード結果だけを残す。
+    手順: 新規シート作成 -> 旧シート(=今回以外)を全削除 -> 展開済みvehiclesを挿入
+    すべて1トランザクションで実施（途中失敗は全ロールバック）。
+    """
+    # 1) PDF解析（出品票メタ＋車両リストを得る）
+    #    解析は CPU バウンドなのでスレッドプールで実行し、イベントループを塞がない
+    #    （PDF 本体はパーサ側で bytes に全部読み込む。プロセスプールへの受け渡しと結果キャッシュのハッシュに必要）
+    try:
+        parsed = await run_in_threadpool(parser.parse_auction_sheet, file.file, file.filename)  # AuctionSheetIn 相当の dict
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to parse PDF: {e}")
+
+    # 2)〜4) DB保存はブロッキング処理なのでイベントループから外す
+    return await run_in_threadpool(_persist, parsed, db)
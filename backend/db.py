@@ -1,5 +1,5 @@
 # backend/db.py
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 
@@ -9,8 +9,25 @@ DATABASE_URL = f"sqlite:///{DB_PATH}"   # ← 絶対パスに固定
 
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False},
+    connect_args={"check_same_thread": False, "timeout": 30},  # ロック待ちは最大30秒
 )
+
+# --- 接続ごとの SQLite PRAGMA（WAL で読み書きを並行させ、commit 時の fsync を減らす） ---
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",      # 約64MB
+    "PRAGMA mmap_size=268435456",    # 256MB
+)
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragma(dbapi_conn, _conn_record):
+    cur = dbapi_conn.cursor()
+    for p in _SQLITE_PRAGMAS:
+        cur.execute(p)
+    cur.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -30,6 +47,13 @@ def ensure_column(engine, table: str, column: str, type_sql: str) -> None:
         if column not in cols:
             conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {type_sql}"))
 
+def ensure_index(engine, name: str, table: str, columns: str) -> None:
+    """存在しないインデックスだけを作成する（既存DBは create_all で作られないため）"""
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
 def ensure_schema(engine) -> None:
     # 必要に応じて増やせます
-    ensure_column(engine, "vehicles", "lane", "TEXT")
\ No newline at end of file
+    ensure_column(engine, "vehicles", "lane", "TEXT")
+    ensure_index(engine, "ix_auction_sheets_uploaded_at", "auction_sheets", "uploaded_at")
+    ensure_index(engine, "ix_valuations_vehicle_created", "valuations", "vehicle_id, created_at")
\ No newline at end of file
@@ -3,6 +3,7 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import logging
+import os
 import traceback
 
 # ===== ログ & アプリ作成（これが一番最初）=====
@@ -12,7 +13,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger("app")
 
-app = FastAPI(debug=True)  # ← 先にこれが必要（これより前に include_router を書かない）
+# APP_DEBUG=1 のときだけデバッグ（トレースバックをレスポンスに含める）
+DEBUG_ON = os.getenv("APP_DEBUG") == "1"
+
+app = FastAPI(debug=DEBUG_ON)  # ← 先にこれが必要（これより前に include_router を書かない）
 
 # ===== CORS =====
 app.add_middleware(
@@ -27,10 +31,10 @@ app.add_middleware(
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
     logger.exception("UNHANDLED: %s", exc)
-    return JSONResponse(
-        status_code=500,
-        content={"ok": False, "where": "unhandled", "error": str(exc), "traceback": traceback.format_exc()},
-    )
+    content = {"ok": False, "where": "unhandled", "error": str(exc)}
+    if DEBUG_ON:
+        content["traceback"] = traceback.format_exc()
+    return JSONResponse(status_code=500, content=content)
 
 # ===== ルーター登録（app 作成の“後”に書く）=====
 from api.upload import router as upload_router
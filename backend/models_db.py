@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, JSON, Index
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 from db import Base
 
@@ -10,7 +10,7 @@ class AuctionSheet(Base):
     file_name = Column(String, nullable=False)
     auction_name = Column(String, nullable=True)
     auction_date = Column(Date, nullable=True)
-    uploaded_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    uploaded_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)  # /sheets の ORDER BY 用
 
     vehicles = relationship("Vehicle", back_populates="sheet", cascade="all, delete-orphan")
 
@@ -31,7 +31,8 @@ class Vehicle(Base):
     inspection_until = Column(String, nullable=True)
     score = Column(String, nullable=True)
     start_price_yen = Column(Integer, nullable=True)
-    raw_extracted_json = Column(JSON, nullable=True)
+    # 一覧系では使わない大きめの JSON なので遅延ロード（必要な所で undefer する）
+    raw_extracted_json = deferred(Column(JSON(none_as_null=True), nullable=True))
     lane = Column(String, nullable=True)             # ← 追加
 
     sheet = relationship("AuctionSheet", back_populates="vehicles")
@@ -39,6 +40,9 @@ class Vehicle(Base):
 
 class Valuation(Base):
     __tablename__ = "valuations"
+    __table_args__ = (
+        Index("ix_valuations_vehicle_created", "vehicle_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     vehicle_id = Column(Integer, ForeignKey("vehicles.id", ondelete="CASCADE"), index=True, nullable=False)
@@ -0,0 +1,33 @@
+# backend/services/cache.py
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# 一覧系レスポンスの簡易 TTL キャッシュ（プロセス内）
+# データが変わるのはアップロード時だけなので、upload 完了時に clear() する
+_TTL_SEC = 30.0
+_MAX_ENTRIES = 16
+
+_store: Dict[Hashable, Tuple[float, Any]] = {}
+_lock = threading.Lock()
+
+def get(key: Hashable) -> Optional[Any]:
+    """期限内ならキャッシュ値、なければ None"""
+    hit = _store.get(key)
+    if hit is None:
+        return None
+    expires_at, value = hit
+    if expires_at < time.monotonic():
+        _store.pop(key, None)
+        return None
+    return value
+
+def put(key: Hashable, value: Any) -> None:
+    with _lock:
+        if key not in _store and len(_store) >= _MAX_ENTRIES:
+            _store.pop(next(iter(_store)))  # 一番古いものを捨てる
+        _store[key] = (time.monotonic() + _TTL_SEC, value)
+
+def clear() -> None:
+    with _lock:
+        _store.clear()
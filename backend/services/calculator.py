@@ -1,4 +1,5 @@
 # backend/services/calculator.py
+from functools import lru_cache
 from typing import Dict, Any, Tuple, Optional
 
 DEFAULT_MARKET = {
@@ -18,6 +19,20 @@ def estimate_resource_value(
 
     # 超簡易な重量・比率（MVPの仮置き）
     est_weight_kg = 1200 if ("プリウス" in (vehicle.get("car_name") or "")) else 1100
+
+    # 結果は (重量, 相場) だけで決まるのでキャッシュする（相場に unhashable な値があれば素通し）
+    try:
+        resource_value, breakdown = _compute_resource_value(est_weight_kg, tuple(sorted(m.items())))
+    except TypeError:
+        resource_value, breakdown = _compute_resource_value.__wrapped__(est_weight_kg, tuple(m.items()))
+    return resource_value, dict(breakdown)  # キャッシュ側の dict を呼び出し元に触らせない
+
+@lru_cache(maxsize=1024)
+def _compute_resource_value(
+    est_weight_kg: int,
+    market_items: Tuple[Tuple[str, Any], ...],
+) -> Tuple[int, Dict[str, Any]]:
+    m = dict(market_items)
     iron_ratio, al_ratio, cu_ratio = 0.75, 0.10, 0.01
 
     breakdown = {
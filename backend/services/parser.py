@@ -1,62 +1,40 @@
+import hashlib
 import io
+import logging
+import multiprocessing
 import re
-import unicodedata
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import date
-from typing import Any, Dict, List, Optional
+from functools import lru_cache, partial
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
 import os
 import json
 
 import pdfplumber
+from pdfminer.pdfpage import PDFPage
+
+from services.parser_text import (
+    z2h, to_int_or_none, parse_japanese_year, parse_mileage_km, parse_auction_date_from_text,
+)
+
+logger = logging.getLogger(__name__)
 
 # ==== デバッグ ====
 DEBUG_ON = os.getenv("PARSER_DEBUG") == "1"
+# 解析元の行データ（raw_extracted_json）を残すか。車両数ぶんメモリと JSON 化コストが増えるので既定はオフ
+# PARSER_DEBUG のときはレイアウト調査に使うので常に残す
+KEEP_RAW = DEBUG_ON or os.getenv("PARSER_KEEP_RAW") == "1"
 
-def trace(stage: str, msg: str, extra: Dict[str, Any] = None):
+def trace(stage: str, msg: str, extra: Optional[Dict[str, Any]] = None) -> None:
     if not DEBUG_ON: return
-    extra_str = f" | {extra}" if extra else ""
-    print(f"[TRACE] {stage}: {msg}{extra_str}")
-
-# ==== ユーティリティ ====
-ZEN2HAN = str.maketrans("０１２３４５６７８９－，．／", "0123456789-,./")
-def z2h(s: Optional[str]) -> str:
-    return unicodedata.normalize("NFKC", (s or "")).translate(ZEN2HAN).strip()
-
-def to_int_or_none(s: Optional[str]) -> Optional[int]:
-    if s is None: return None
-    s2 = re.sub(r"[^\d]", "", z2h(s))
-    if not s2: return None
-    try:
-        return int(s2)
-    except ValueError:
-        return None
-
-def parse_japanese_year(s: Optional[str]) -> Optional[int]:
-    if not s: return None
-    s_norm = z2h(s)
-    m = re.search(r"[Hh平成](\d{1,2})", s_norm)
-    if m: return 1988 + int(m.group(1))
-    m = re.search(r"[Rr令](\d{1,2})", s_norm)
-    if m: return 2018 + int(m.group(1))
-    return to_int_or_none(s_norm)
-
-def parse_mileage_km(s: Optional[str]) -> Optional[int]:
-    if not s: return None
-    val = to_int_or_none(s)
-    if val is not None and val < 1000:
-        return val * 1000
-    return val
-
-def parse_auction_date_from_text(text: str) -> Optional[date]:
-    t = z2h(text)
-    m = re.search(r"(20\d{2})[/\.](\d{1,2})[/\.](\d{1,2})", t)
-    if m:
-        try: return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
-        except ValueError: pass
-    m = re.search(r"([Rr令])(\d{1,2})[/\.](\d{1,2})", t)
-    if m:
-        try: return date(2018 + int(m.group(2)), int(m.group(3)), 1)
-        except ValueError: pass
-    return None
+    logger.info("[TRACE] %s: %s%s", stage, msg, f" | {extra}" if extra else "")
+
+# ==== 正規表現（モジュール読み込み時に1回だけコンパイル） ====
+_RE_VENUE = re.compile(r"(USS|JU|TAA)\s*([\u4E00-\u9FFF]{1,10})")  # 会場名は長くても数文字
 
 # ==== 座標ベースのテーブル再構築 ====
 HEADER_KEYWORDS: Dict[str, str] = {
@@ -65,60 +43,76 @@ HEADER_KEYWORDS: Dict[str, str] = {
     "走行": "mileage_km", "色": "color", "ｼﾌﾄ": "shift", "ｴｱｺﾝ": "aircon",
     "装備": "equipment", "評価点": "score", "ｽﾀｰﾄ": "start_price_yen", "ﾚｰﾝ": "lane"
 }
+# 全キーワードを1本の選択パターンにまとめ、単語ごとに1回の match で判定する（長い順で最長一致）
+_RE_HEADER = re.compile("|".join(map(re.escape, sorted(HEADER_KEYWORDS, key=len, reverse=True))))
 
-def build_layout_from_page(page: pdfplumber.page.Page) -> List[Dict[str, Any]]:
-    words = page.extract_words(x_tolerance=2, y_tolerance=2, keep_blank_chars=True)
+@lru_cache(maxsize=1024)
+def _match_header_keyword(text: str) -> Optional[str]:
+    """見出し候補の単語 → フィールド名（同じ見出しが全ページに出るのでキャッシュ）"""
+    field_name = HEADER_KEYWORDS.get(text)  # ほとんどの見出しはキーワードそのもの
+    if field_name is not None: return field_name
+    m = _RE_HEADER.match(text)
+    return HEADER_KEYWORDS[m.group(0)] if m else None
+
+def extract_page_words(page: pdfplumber.page.Page) -> List[Dict[str, Any]]:
+    return page.extract_words(x_tolerance=2, y_tolerance=2, keep_blank_chars=True)
+
+def build_layout_from_page(page: pdfplumber.page.Page, words: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    if words is None:
+        words = extract_page_words(page)
     if not words: return []
 
     header_words: Dict[str, Dict[str, Any]] = {}
     for word in [w for w in words if w['top'] < page.height * 0.2]:
-        for keyword, field_name in HEADER_KEYWORDS.items():
-            if word['text'].strip().startswith(keyword):
-                if field_name not in header_words or word['x0'] < header_words[field_name]['x0']:
-                    header_words[field_name] = word
+        field_name = _match_header_keyword(word['text'].strip())
+        if field_name is None: continue
+        if field_name not in header_words or word['x0'] < header_words[field_name]['x0']:
+            header_words[field_name] = word
 
     if not header_words:
         trace("layout_build", "Header keywords not found", {"page": page.page_number})
         return []
 
     sorted_headers = sorted(header_words.values(), key=lambda w: w['x0'])
-    columns = []
+    columns: List[Dict[str, Any]] = []
     for i, header_word in enumerate(sorted_headers):
         field_name = next(k for k, v in header_words.items() if v == header_word)
         x0 = header_word['x0']
         x1 = sorted_headers[i + 1]['x0'] if i + 1 < len(sorted_headers) else page.width
         columns.append({'name': field_name, 'x0': x0 - 2, 'x1': x1 - 2})
 
-    lines: Dict[float, List[Dict[str, Any]]] = {}
     header_bottom = max(w['bottom'] for w in sorted_headers)
     data_words = [w for w in words if w['top'] > header_bottom]
 
+    # 行の y 座標（各行の最初の単語の中心）を昇順で持ち、bisect で近い行を探す
+    line_ys: List[float] = []
+    line_buckets: List[List[Dict[str, Any]]] = []
     for word in data_words:
         y_center = (word['top'] + word['bottom']) / 2
-        found_line = False
-        for y_key in lines.keys():
-            if abs(y_key - y_center) < 5:
-                lines[y_key].append(word)
-                found_line = True
-                break
-        
-        # ▼▼▼ 修正点: y_keyが定義されていない場合はy_centerを新しいキーとして使う ▼▼▼
-        if not found_line:
-            lines[y_center] = [word]
-        # ▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲
-
-    rows = []
-    for y_key in sorted(lines.keys()):
-        line_words = sorted(lines[y_key], key=lambda w: w['x0'])
-        row_data: Dict[str, str] = {c['name']: "" for c in columns}
+        i = bisect_left(line_ys, y_center)
+        # 挿入位置の前後どちらかが ±5 以内なら同じ行（近いほうを優先）
+        j = min((k for k in (i - 1, i) if 0 <= k < len(line_ys) and abs(line_ys[k] - y_center) < 5),
+                key=lambda k: abs(line_ys[k] - y_center), default=None)
+        if j is not None:
+            line_buckets[j].append(word)
+        else:
+            line_ys.insert(i, y_center)
+            line_buckets.insert(i, [word])
+
+    # 行内のセルは列番号で引く list に溜め、最後に1回だけ join して dict にする
+    col_names = [c['name'] for c in columns]
+    col_x0 = [c['x0'] for c in columns]  # x0 昇順（列は隙間なく並ぶので bisect で1回で引ける）
+    col_x1 = [c['x1'] for c in columns]
+    rows: List[Dict[str, str]] = []
+    for bucket in line_buckets:
+        line_words = sorted(bucket, key=lambda w: w['x0'])
+        cells: List[List[str]] = [[] for _ in columns]
         for word in line_words:
             word_center_x = (word['x0'] + word['x1']) / 2
-            for col in columns:
-                if col['x0'] <= word_center_x < col['x1']:
-                    if row_data[col['name']]: row_data[col['name']] += " "
-                    row_data[col['name']] += word['text']
-                    break
-        for k, v in row_data.items(): row_data[k] = v.strip()
+            ci = bisect_right(col_x0, word_center_x) - 1
+            if ci >= 0 and word_center_x < col_x1[ci]:
+                cells[ci].append(word['text'])
+        row_data: Dict[str, str] = dict(zip(col_names, (" ".join(parts).strip() for parts in cells)))
         if not row_data.get("auction_no") or not row_data["auction_no"].isdigit(): continue
         rows.append(row_data)
 
@@ -126,56 +120,206 @@ def build_layout_from_page(page: pdfplumber.page.Page) -> List[Dict[str, Any]]:
     return rows
 
 # ==== メイン処理 ====
-def parse_auction_sheet(pdf_bytes: bytes, filename: str) -> Dict[str, Any]:
-    trace("start", "parse begin (coordinate-based)", {"file": filename})
-    all_vehicles: List[Dict[str, Any]] = []
-    
+# ページ並列数（0/1 で逐次。uvicorn を複数 worker で動かすときは 1 にしておく）
+PARSER_WORKERS = int(os.getenv("PARSER_WORKERS") or min(os.cpu_count() or 1, 8))  # 既定は最大8（それ以上はメモリが先に効く）
+_PARALLEL_MIN_PAGES = 10  # これ未満の小さい PDF はプロセス間通信のほうが高くつくので同一プロセスで処理
+_PAGES_PER_TASK = 10  # 1タスクあたりの最大ページ数（PDF を開き直すコストを均す）
+_INLINE_PAGES_PER_OPEN = 50  # 同一プロセスで処理するときに1回で読み込むページ数（メモリの上限）
+
+# プロセスプールはアップロードごとに作らず、最初に必要になった時点で1つだけ起動して使い回す
+# forkserver は POSIX のみ。Windows などでは spawn にする
+_POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # スレッドを抱えた uvicorn プロセス（DB プールやロック込み）を fork しないよう、
+            # worker はクリーンなインタプリタから起動する
+            _pool = ProcessPoolExecutor(max_workers=PARSER_WORKERS,
+                                        mp_context=multiprocessing.get_context(_POOL_START_METHOD))
+        return _pool
+
+def _reset_pool(failed: ProcessPoolExecutor) -> None:
+    """壊れたプールを捨てる。他のアップロードが既に作り直していれば何もしない"""
+    global _pool
+    with _pool_lock:
+        if _pool is not failed: return
+        _pool = None
+    # 他スレッドの処理中タスクを巻き込まないよう cancel_futures はしない
+    failed.shutdown(wait=False)
+
+def _rows_to_vehicles(rows: List[Dict[str, str]], page_number: int) -> List[Dict[str, Any]]:
+    vehicles: List[Dict[str, Any]] = []
+    for i, row in enumerate(rows):
+        try:
+            vehicle: Dict[str, Any] = {
+                "auction_no": row.get("auction_no"),
+                "maker": row.get("maker"),
+                "car_name": row.get("car_name"),
+                "grade": row.get("grade"),
+                "model_code": row.get("model_code"),
+                "year": parse_japanese_year(row.get("year")),
+                "displacement_cc": to_int_or_none(row.get("displacement_cc")),
+                "mileage_km": parse_mileage_km(row.get("mileage_km")),
+                "inspection_until": row.get("inspection_until"),
+                "color": row.get("color"),
+                "shift": row.get("shift"),
+                "aircon": row.get("aircon"),
+                "equipment": row.get("equipment"),
+                "score": row.get("score"),
+                "start_price_yen": to_int_or_none(row.get("start_price_yen")),  # カンマは to_int_or_none が落とす
+                "lane": row.get("lane"),
+                "raw_extracted_json": {"coordinate_based_row": row} if KEEP_RAW else None
+            }
+            vehicles.append(vehicle)
+        except Exception as e:
+            logger.warning("row %d on page %d skipped: %s | row=%s", i, page_number, e, row)
+            continue
+    return vehicles
+
+# extract_text() の既定値。単語は x_tolerance=2 で切っているので、2〜3pt の字間で
+# 分かれた単語（例: "2024/0" "5/10"）はテキスト化するときにつなぎ直す
+_TEXT_X_TOLERANCE = 3
+_TEXT_Y_TOLERANCE = 3
+
+def _words_to_text(words: List[Dict[str, Any]]) -> str:
+    """extract_text() 相当のテキストを単語列から作る（同じ行は空白、行の変わり目は改行で区切る）"""
+    parts: List[str] = []
+    prev: Optional[Dict[str, Any]] = None
+    for w in words:
+        if prev is not None:
+            if abs(w['top'] - prev['top']) > _TEXT_Y_TOLERANCE:
+                parts.append("\n")
+            elif w['x0'] - prev['x1'] > _TEXT_X_TOLERANCE:
+                parts.append(" ")
+        parts.append(w['text'])
+        prev = w
+    return "".join(parts)
+
+def _parse_page(page: pdfplumber.page.Page) -> Tuple[str, List[Dict[str, Any]]]:
+    """1ページ分の (テキスト, 車両リスト)"""
+    trace("parser", f"Processing page {page.page_number}")
+    # 文字の走査は重いので1回だけ。会場名・日付用のテキストも同じ単語列から作る
+    try:
+        words = extract_page_words(page)
+        text = _words_to_text(words)
+        return text, _rows_to_vehicles(build_layout_from_page(page, words), page.page_number)
+    finally:
+        page.close()  # chars/objects のキャッシュを解放（ページ数が多いとメモリが積み上がる）
+
+def _process_pages(pdf_bytes: bytes, start: int, stop: int) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """プロセスプール用: worker 側で PDF を1回だけ開き直し、連続したページ範囲を処理する"""
+    # pages= で担当範囲（1始まり）だけを読み込む
+    with pdfplumber.open(io.BytesIO(pdf_bytes), pages=list(range(start + 1, stop + 1))) as pdf:
+        return [_parse_page(page) for page in pdf.pages]
+
+def _parse_pages_inline(pdf_bytes: bytes, n_pages: int) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """同一プロセスで処理する。全ページを一度に開かず、_INLINE_PAGES_PER_OPEN ページずつ開き直す"""
+    results: List[Tuple[str, List[Dict[str, Any]]]] = []
+    for start in range(0, n_pages, _INLINE_PAGES_PER_OPEN):
+        results.extend(_process_pages(pdf_bytes, start, min(start + _INLINE_PAGES_PER_OPEN, n_pages)))
+    return results
+
+def _count_pages(pdf_bytes: bytes) -> int:
+    """pdf.pages（pdfplumber の Page）を作らずにページ数だけ数える。
+    /Count は信用しない（pdfminer は /Kids をたどるので、/Count が少ないと後ろのページを取りこぼす）"""
     with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-        full_text = "".join(p.extract_text() or "" for p in pdf.pages)
-        m = re.search(r"(USS|JU|TAA)\s*([\u4E00-\u9FFF]+)", full_text)
-        auction_name = f"{m.group(1)}{m.group(2)}" if m else None
-        auction_date = parse_auction_date_from_text(full_text)
-
-        for page in pdf.pages:
-            trace("parser", f"Processing page {page.page_number}")
-            reconstructed_rows = build_layout_from_page(page)
-            
-            for i, row in enumerate(reconstructed_rows):
-                try:
-                    start_price_str = row.get("start_price_yen", "") or ""
-                    
-                    vehicle: Dict[str, Any] = {
-                        "auction_no": row.get("auction_no"),
-                        "maker": row.get("maker"),
-                        "car_name": row.get("car_name"),
-                        "grade": row.get("grade"),
-                        "model_code": row.get("model_code"),
-                        "year": parse_japanese_year(row.get("year")),
-                        "displacement_cc": to_int_or_none(row.get("displacement_cc")),
-                        "mileage_km": parse_mileage_km(row.get("mileage_km")),
-                        "inspection_until": row.get("inspection_until"),
-                        "color": row.get("color"),
-                        "shift": row.get("shift"),
-                        "aircon": row.get("aircon"),
-                        "equipment": row.get("equipment"),
-                        "score": row.get("score"),
-                        "start_price_yen": to_int_or_none(start_price_str.replace(",", "")),
-                        "lane": row.get("lane"),
-                        "raw_extracted_json": {"coordinate_based_row": row}
-                    }
-                    all_vehicles.append(vehicle)
-                except Exception as e:
-                    print(f"--- ERROR parsing row {i} on page {page.page_number} ---")
-                    print(f"Row data: {row}")
-                    print(f"Error: {e}")
-                    print("-----------------------------------------------------")
-                    continue
-            
-    trace("parse_done", "end", {"vehicles": len(all_vehicles)})
-
-    return {
+        return sum(1 for _ in PDFPage.create_pages(pdf.doc))
+
+# ==== 解析結果キャッシュ（PDF の中身のハッシュ → 結果） ====
+_RESULT_CACHE_MAX = 32
+_result_cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+def _result_cache_get(key: bytes) -> Optional[Dict[str, Any]]:
+    with _result_cache_lock:
+        hit = _result_cache.get(key)
+        if hit is not None:
+            _result_cache.move_to_end(key)
+        return hit
+
+def _result_cache_put(key: bytes, result: Dict[str, Any]) -> None:
+    with _result_cache_lock:
+        _result_cache[key] = result
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > _RESULT_CACHE_MAX:
+            _result_cache.popitem(last=False)
+
+def _copy_result(result: Dict[str, Any], filename: str) -> Dict[str, Any]:
+    # 呼び出し側（upload）が車両 dict を書き換えるので、キャッシュ本体は渡さない
+    out = dict(result)
+    out["file_name"] = filename
+    out["vehicles"] = [dict(v) for v in result["vehicles"]]
+    return out
+
+def parse_auction_sheet(source: Union[bytes, BinaryIO], filename: str) -> Dict[str, Any]:
+    """source は PDF の bytes でもファイルライク（UploadFile.file など）でもよい"""
+    trace("start", "parse begin (coordinate-based)", {"file": filename})
+    # worker に渡すため bytes にそろえる
+    pdf_bytes = bytes(source) if isinstance(source, (bytes, bytearray)) else source.read()
+
+    # 同じ PDF の再アップロード（リトライ等）は解析結果をそのまま使う
+    key = hashlib.blake2b(pdf_bytes, digest_size=16).digest()
+    cached = _result_cache_get(key)
+    if cached is not None:
+        trace("cache_hit", "reuse parsed result", {"file": filename})
+        return _copy_result(cached, filename)
+
+    n_pages = _count_pages(pdf_bytes)
+    if PARSER_WORKERS <= 1 or n_pages < _PARALLEL_MIN_PAGES:
+        results = _parse_pages_inline(pdf_bytes, n_pages)
+    else:
+        # worker 数で均等割りしつつ、1タスクは最大 _PAGES_PER_TASK ページ
+        per_task = min(_PAGES_PER_TASK, -(-n_pages // PARSER_WORKERS))
+        starts = range(0, n_pages, per_task)
+        stops = [min(i + per_task, n_pages) for i in starts]
+        pool: Optional[ProcessPoolExecutor] = None
+        try:
+            pool = _get_pool()
+            batches = pool.map(partial(_process_pages, pdf_bytes), starts, stops)
+        except (ValueError, OSError, RuntimeError) as e:
+            # プールを作れない／投入できない（start method が無い、forkserver 起動失敗、
+            # 別アップロードが壊した・閉じたプール）。この PDF のせいではないので同一プロセスで処理する
+            logger.warning("parse pool unavailable (%r); falling back to in-process parsing", e)
+            if pool is not None and isinstance(e, BrokenProcessPool):
+                _reset_pool(pool)
+            results = _parse_pages_inline(pdf_bytes, n_pages)
+        else:
+            try:
+                results = [r for batch in batches for r in batch]
+            except BrokenProcessPool as e:
+                # この PDF の処理中に worker が落ちた（メモリ不足など）。同じ PDF をサーバ内で
+                # 解析し直すと同じ落ち方をしかねないので、やり直さずに失敗として返す
+                logger.error("parse worker crashed on %s: %r", filename, e)
+                _reset_pool(pool)
+                raise RuntimeError("PDF parse worker crashed") from e
+            except CancelledError as e:
+                # 別アップロードのプール破棄に巻き込まれただけなので同一プロセスで処理する
+                logger.warning("parse batches cancelled (%r); falling back to in-process parsing", e)
+                results = _parse_pages_inline(pdf_bytes, n_pages)
+
+    # 会場名・開催日は通常1ページ目にあるので、見つかった時点でテキスト走査を打ち切る
+    auction_name: Optional[str] = None
+    auction_date: Optional[date] = None
+    for text, _ in results:
+        if auction_name is None:
+            m = _RE_VENUE.search(text)
+            if m: auction_name = f"{m.group(1)}{m.group(2)}"
+        if auction_date is None:
+            auction_date = parse_auction_date_from_text(text)
+        if auction_name and auction_date: break
+    all_vehicles: List[Dict[str, Any]] = [v for _, vehicles in results for v in vehicles]
+
+    trace("parse_done", "end", {"vehicles": len(all_vehicles), "raw_kept": len(all_vehicles) if KEEP_RAW else 0})
+
+    result = {
         "file_name": filename,
         "auction_name": auction_name,
         "auction_date": auction_date.isoformat() if auction_date else None,
         "vehicles": all_vehicles,
-    }
\ No newline at end of file
+    }
+    _result_cache_put(key, result)
+    return _copy_result(result, filename)
@@ -0,0 +1,74 @@
+# backend/services/parser_text.py
+# セル文字列の正規化・数値化など pdfplumber に依存しない純粋なテキスト処理
+import os
+import re
+import unicodedata
+from datetime import date
+from functools import lru_cache
+from typing import Optional
+
+# ==== 正規表現（モジュール読み込み時に1回だけコンパイル） ====
+_RE_NONDIGIT = re.compile(r"[^\d]")
+_RE_HEISEI = re.compile(r"[Hh平成](\d{1,2})")
+_RE_REIWA = re.compile(r"[Rr令](\d{1,2})")
+_RE_YMD = re.compile(r"(20\d{2})[/\.](\d{1,2})[/\.](\d{1,2})")
+_RE_REIWA_YM = re.compile(r"([Rr令])(\d{1,2})[/\.](\d{1,2})")
+
+# ==== ユーティリティ ====
+# セル単位キャッシュの上限（PDF が大きい・値の種類が多い環境では増やす）
+_LRU_SIZE = int(os.getenv("PARSER_LRU_SIZE") or 16384)
+
+# 同じセル値（色・シフト・空欄など）が何千回も出るので正規化結果をキャッシュする
+def z2h(s: Optional[str]) -> str:
+    if not s: return ""
+    return _z2h_cached(s)
+
+@lru_cache(maxsize=_LRU_SIZE)
+def _z2h_cached(s: str) -> str:
+    if s.isascii(): return s.strip()  # ASCII は NFKC で変わらない
+    # 全角数字・記号（０-９ － ， ． ／）は NFKC だけで半角になるので追加の translate は不要
+    return unicodedata.normalize("NFKC", s).strip()
+
+# ASCII の数字以外を全部落とす translate 表（ASCII 入力は NFKC も正規表現も不要）
+_ASCII_NONDIGIT_DEL = {c: None for c in range(128) if not chr(c).isdigit()}
+
+@lru_cache(maxsize=_LRU_SIZE)
+def to_int_or_none(s: Optional[str]) -> Optional[int]:
+    if s is None: return None
+    if s.isascii():
+        s2 = s.translate(_ASCII_NONDIGIT_DEL)
+    else:
+        s2 = _RE_NONDIGIT.sub("", z2h(s))
+    if not s2: return None
+    try:
+        return int(s2)
+    except ValueError:
+        return None
+
+def parse_japanese_year(s: Optional[str]) -> Optional[int]:
+    if not s: return None
+    s_norm = z2h(s)
+    m = _RE_HEISEI.search(s_norm)
+    if m: return 1988 + int(m.group(1))
+    m = _RE_REIWA.search(s_norm)
+    if m: return 2018 + int(m.group(1))
+    return to_int_or_none(s_norm)
+
+def parse_mileage_km(s: Optional[str]) -> Optional[int]:
+    if not s: return None
+    val = to_int_or_none(s)
+    if val is not None and val < 1000:
+        return val * 1000
+    return val
+
+def parse_auction_date_from_text(text: str) -> Optional[date]:
+    t = z2h(text)
+    m = _RE_YMD.search(t)
+    if m:
+        try: return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+        except ValueError: pass
+    m = _RE_REIWA_YM.search(t)
+    if m:
+        try: return date(2018 + int(m.group(2)), int(m.group(3)), 1)
+        except ValueError: pass
+    return None
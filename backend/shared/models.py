@@ -16,7 +16,7 @@ class VehicleIn(BaseModel):
     inspection_until: Optional[str] = None
     score: Optional[str] = None
     start_price_yen: Optional[int] = None
-    raw_extracted_json: Optional[Dict[str, Any]] = None
+    raw_extracted_json: Any = None  # デバッグ用の生データ。中身までは検証しない
     displacement_cc: Optional[int] = None
     aircon: Optional[str] = None
     equipment: Optional[str] = None